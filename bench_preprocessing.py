@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from dl_model import DLModelApp
+from ids_features import FEATURE_COLUMNS
+
+
+def create_synthetic_db(db_path, n_flows):
+    """Fill an extracted_features table with random flows."""
+    rng = np.random.default_rng(0)
+    connection = sqlite3.connect(db_path)
+    cursor = connection.cursor()
+    cursor.execute('''
+        CREATE TABLE extracted_features (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            flow_id TEXT,
+            flow_duration REAL,
+            flow_bytes_per_second REAL,
+            forward_header_length INTEGER,
+            backward_header_length INTEGER,
+            packet_length_std_dev REAL,
+            packet_size_avg REAL
+        )
+    ''')
+    rows = []
+    for i in range(n_flows):
+        rows.append((
+            str(('10.0.0.1', f'10.0.{i // 256 % 256}.{i % 256}', 1024 + i % 60000, 80, 'TCP')),
+            float(rng.exponential(5.0)),
+            float(rng.exponential(1e5)),
+            int(rng.integers(40, 4000)),
+            int(rng.integers(40, 4000)),
+            float(rng.exponential(300.0)),
+            float(rng.uniform(60, 1500)),
+        ))
+    cursor.executemany(f'''
+        INSERT INTO extracted_features (flow_id, {', '.join(FEATURE_COLUMNS)})
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    connection.commit()
+    connection.close()
+
+
+def measure(app, load, normalize):
+    """Return the wall time and peak traced memory of one load + normalize pass."""
+    # Time an untraced run, tracemalloc slows down every Python allocation
+    start = time.perf_counter()
+    load()
+    normalize()
+    elapsed = time.perf_counter() - start
+    x = np.asarray(app.x_test, dtype=np.float32)
+
+    # Measure peak memory in a separate traced run
+    app.x_test = app.data = None
+    tracemalloc.start()
+    load()
+    normalize()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, x
+
+
+def run_benchmark(scaler_path='standard_scaler_Trans_bi.pkl', n_flows=100000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        create_synthetic_db(db_path, n_flows)
+
+        app = DLModelApp(model_path=None, scaler_path=scaler_path, db_path=db_path)
+        app.load_scaler()
+
+        pandas_time, pandas_peak, pandas_x = measure(app, app.load_data, app.normalize_data)
+        numpy_time, numpy_peak, numpy_x = measure(app, app.load_data_numpy, app.normalize_data_inplace)
+
+    print(f"Flows: {n_flows}")
+    print(f"pandas path: {pandas_time:.3f} s, peak {pandas_peak / 2**20:.1f} MiB")
+    print(f"numpy path:  {numpy_time:.3f} s, peak {numpy_peak / 2**20:.1f} MiB")
+    print(f"Speedup: {pandas_time / numpy_time:.2f}x, "
+          f"memory ratio: {pandas_peak / max(numpy_peak, 1):.2f}x")
+    print(f"Max abs difference: {np.max(np.abs(pandas_x - numpy_x)):.2e}")
+
+
+if __name__ == '__main__':
+    run_benchmark()
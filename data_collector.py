@@ -2,13 +2,31 @@ from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
 from ryu.ofproto import ofproto_v1_3
+from ryu.lib import hub
 from ryu.lib.packet import packet, ethernet, ipv4, ipv6, tcp, udp, icmp, icmpv6, arp
+from dp_workers import DatapathWorkerPool
+from sequence_features import FlowSequenceTable
+from collections import OrderedDict
+import heapq
 import time
 import sqlite3
 
 class PacketCaptureApp(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
+    NUM_WORKERS = 4
+    WORKER_QUEUE_SIZE = 4096
+    FLUSH_INTERVAL = 1.0  # seconds between writes of the packet buffers
+    MAX_UNWRITTEN_ROWS = 100000  # rows kept for retry while the database fails
+    REPORT_INTERVAL = 30.0  # seconds between per-datapath load reports
+    # Sequence mode: snapshot a flow's running features every SEQUENCE_WINDOW
+    # packets so it is classified without waiting for the extraction cycle.
+    # Flows only advance on PacketIns, so enable MIRROR_TO_CONTROLLER in
+    # simple_switch.py as well
+    SEQUENCE_MODE = False
+    SEQUENCE_WINDOW = 8
+    SEQUENCE_MAX_FLOWS = 4096
+
     def __init__(self, *args, **kwargs):
         super(PacketCaptureApp, self).__init__(*args, **kwargs)
         
@@ -16,19 +34,43 @@ class PacketCaptureApp(app_manager.RyuApp):
         self.db_connection = sqlite3.connect('ids_data.db')
         self.cursor = self.db_connection.cursor()
 
+        # dpid -> list of parsed rows waiting to be written
+        self.packet_buffers = {}
+        self.rows_written = 0
+        # Rows of failed flushes, retried first on the next flush
+        self.unwritten_rows = []
+        self.unwritten_snapshots = []
+        self.rows_dropped = 0
+
+        self.sequence_table = None
+        self.ready_snapshots = []
+        # source IP -> (first timestamp, dpid) of the switch it entered at
+        self.ingress_dpids = OrderedDict()
+        if self.SEQUENCE_MODE:
+            self.sequence_table = FlowSequenceTable(self.SEQUENCE_WINDOW, self.SEQUENCE_MAX_FLOWS)
+
+        # Parse PacketIns on per-datapath workers and merge their buffers
+        # into the database from a single writer thread
+        self.workers = DatapathWorkerPool(self.process_packet, self.logger,
+                                          self.NUM_WORKERS, self.WORKER_QUEUE_SIZE)
+        self.flush_thread = hub.spawn(self._flush_loop)
+        self.report_thread = hub.spawn(self._report_loop)
+
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
-        msg = ev.msg
-        dp = msg.datapath
-        in_port = msg.match['in_port']
+        # Stamp the arrival time here, parsing happens on the datapath's worker
+        self.workers.submit(ev.msg.datapath.id, (time.time(), ev.msg.data))
+
+    def process_packet(self, dpid, item):
+        timestamp, data = item
 
         # Parse the packet
-        pkt = packet.Packet(msg.data)
+        pkt = packet.Packet(data)
         eth = pkt.get_protocol(ethernet.ethernet)
 
         # Get Ethernet type and packet length
         eth_type = eth.ethertype
-        pkt_len = len(msg.data)  # Total packet size
+        pkt_len = len(data)  # Total packet size
 
         # Handle IPv4 packets
         ipv4_pkt = pkt.get_protocol(ipv4.ipv4)
@@ -37,7 +79,7 @@ class PacketCaptureApp(app_manager.RyuApp):
             dst_ip = ipv4_pkt.dst
             protocol = ipv4_pkt.proto
             ip_header_length = ipv4_pkt.header_length * 4  # IPv4 header length in bytes
-            self.handle_ipv4_packet(pkt, src_ip, dst_ip, protocol, ip_header_length, pkt_len)
+            self.handle_ipv4_packet(dpid, timestamp, pkt, src_ip, dst_ip, protocol, ip_header_length, pkt_len)
             return
 
         # Handle IPv6 packets
@@ -47,25 +89,25 @@ class PacketCaptureApp(app_manager.RyuApp):
             dst_ip = ipv6_pkt.dst
             next_header = ipv6_pkt.nxt
             ip_header_length = 40  # Fixed IPv6 header length
-            self.handle_ipv6_packet(pkt, src_ip, dst_ip, next_header, ip_header_length, pkt_len)
+            self.handle_ipv6_packet(dpid, timestamp, pkt, src_ip, dst_ip, next_header, ip_header_length, pkt_len)
             return
 
         # Handle ARP packets
         arp_pkt = pkt.get_protocol(arp.arp)
         if arp_pkt:
-            self.save_packet_info(arp_pkt.src_ip, arp_pkt.dst_ip, 'N/A', 'N/A', 'ARP', 28, pkt_len)
+            self.save_packet_info(dpid, timestamp, arp_pkt.src_ip, arp_pkt.dst_ip, 'N/A', 'N/A', 'ARP', 28, pkt_len)
             return
 
         self.logger.info(f"Non-IPv4/IPv6/ARP packet received. Ethernet Type: {hex(eth_type)}")
 
-    def handle_ipv4_packet(self, pkt, src_ip, dst_ip, protocol, ip_header_length, pkt_len):
+    def handle_ipv4_packet(self, dpid, timestamp, pkt, src_ip, dst_ip, protocol, ip_header_length, pkt_len):
         if protocol == 6:  # TCP
             tcp_pkt = pkt.get_protocol(tcp.tcp)
             if tcp_pkt:
                 transport_header_length = tcp_pkt.offset * 4  # TCP header length
                 src_port = tcp_pkt.src_port
                 dst_port = tcp_pkt.dst_port
-                self.save_packet_info(src_ip, dst_ip, src_port, dst_port, 'TCP', 
+                self.save_packet_info(dpid, timestamp, src_ip, dst_ip, src_port, dst_port, 'TCP', 
                                       ip_header_length + transport_header_length, pkt_len)
 
         elif protocol == 17:  # UDP
@@ -74,27 +116,27 @@ class PacketCaptureApp(app_manager.RyuApp):
                 transport_header_length = 8  # UDP header length is fixed
                 src_port = udp_pkt.src_port
                 dst_port = udp_pkt.dst_port
-                self.save_packet_info(src_ip, dst_ip, src_port, dst_port, 'UDP', 
+                self.save_packet_info(dpid, timestamp, src_ip, dst_ip, src_port, dst_port, 'UDP', 
                                       ip_header_length + transport_header_length, pkt_len)
 
         elif protocol == 1:  # ICMP
             icmp_pkt = pkt.get_protocol(icmp.icmp)
             if icmp_pkt:
                 transport_header_length = len(icmp_pkt)
-                self.save_packet_info(src_ip, dst_ip, 'N/A', 'N/A', 'ICMP', 
+                self.save_packet_info(dpid, timestamp, src_ip, dst_ip, 'N/A', 'N/A', 'ICMP', 
                                       ip_header_length + transport_header_length, pkt_len)
 
         else:
             self.logger.info(f"Unsupported IPv4 protocol number: {protocol}. Skipping.")
 
-    def handle_ipv6_packet(self, pkt, src_ip, dst_ip, next_header, ip_header_length, pkt_len):
+    def handle_ipv6_packet(self, dpid, timestamp, pkt, src_ip, dst_ip, next_header, ip_header_length, pkt_len):
         if next_header == 6:  # TCP
             tcp_pkt = pkt.get_protocol(tcp.tcp)
             if tcp_pkt:
                 transport_header_length = tcp_pkt.offset * 4  # TCP header length
                 src_port = tcp_pkt.src_port
                 dst_port = tcp_pkt.dst_port
-                self.save_packet_info(src_ip, dst_ip, src_port, dst_port, 'TCPv6', 
+                self.save_packet_info(dpid, timestamp, src_ip, dst_ip, src_port, dst_port, 'TCPv6', 
                                       ip_header_length + transport_header_length, pkt_len)
 
         elif next_header == 17:  # UDP
@@ -103,28 +145,99 @@ class PacketCaptureApp(app_manager.RyuApp):
                 transport_header_length = 8  # UDP header length is fixed
                 src_port = udp_pkt.src_port
                 dst_port = udp_pkt.dst_port
-                self.save_packet_info(src_ip, dst_ip, src_port, dst_port, 'UDPv6', 
+                self.save_packet_info(dpid, timestamp, src_ip, dst_ip, src_port, dst_port, 'UDPv6', 
                                       ip_header_length + transport_header_length, pkt_len)
 
         elif next_header == 58:  # ICMPv6
             icmpv6_pkt = pkt.get_protocol(icmpv6.icmpv6)
             if icmpv6_pkt:
                 transport_header_length = len(icmpv6_pkt)
-                self.save_packet_info(src_ip, dst_ip, 'N/A', 'N/A', 'ICMPv6', 
+                self.save_packet_info(dpid, timestamp, src_ip, dst_ip, 'N/A', 'N/A', 'ICMPv6', 
                                       ip_header_length + transport_header_length, pkt_len)
 
         else:
             self.logger.info(f"Unsupported IPv6 next header: {next_header}. Skipping.")
 
-    def save_packet_info(self, src_ip, dst_ip, src_port, dst_port, protocol, header_length, pkt_len):
-        # Insert packet information into the database
-        self.cursor.execute('''
-            INSERT INTO collected_data (
-                timestamp, source_ip, destination_ip, source_port, 
-                destination_port, protocol, header_length, packet_length
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (time.time(), src_ip, dst_ip, src_port, dst_port, protocol, header_length, pkt_len))
-        self.db_connection.commit()
+    def save_packet_info(self, dpid, timestamp, src_ip, dst_ip, src_port, dst_port, protocol, header_length, pkt_len):
+        # Buffer packet information per datapath until the next flush
+        self.packet_buffers.setdefault(dpid, []).append(
+            (timestamp, src_ip, dst_ip, src_port, dst_port, protocol, header_length, pkt_len))
+
+        # Every switch on the path reports the packet, count it once
+        if self.sequence_table is not None and self.is_ingress(dpid, timestamp, src_ip):
+            flow_id = self.sequence_table.add_packet(timestamp, src_ip, dst_ip, src_port, dst_port,
+                                                     protocol, header_length, pkt_len)
+            if flow_id is not None:
+                features = self.sequence_table.get_features(flow_id)
+                self.ready_snapshots.append((str(flow_id), self.sequence_table.packet_count(flow_id))
+                                            + tuple(float(value) for value in features))
+
+    def is_ingress(self, dpid, timestamp, src_ip):
+        """Return True if dpid is the switch where traffic from src_ip enters the network."""
+        # The ingress switch is the first one to report a source
+        first = self.ingress_dpids.get(src_ip)
+        if first is None or timestamp < first[0]:
+            first = self.ingress_dpids[src_ip] = (timestamp, dpid)
+            if len(self.ingress_dpids) > self.SEQUENCE_MAX_FLOWS:
+                self.ingress_dpids.popitem(last=False)
+        return first[1] == dpid
+
+    def flush_packets(self):
+        """Merge the per-datapath buffers by timestamp and write them in one transaction."""
+        buffers, self.packet_buffers = self.packet_buffers, {}
+        snapshots, self.ready_snapshots = self.unwritten_snapshots + self.ready_snapshots, []
+        self.unwritten_snapshots = []
+
+        # Each buffer is already in arrival order, so a k-way merge is enough
+        rows = list(heapq.merge(self.unwritten_rows, *buffers.values(), key=lambda row: row[0]))
+        self.unwritten_rows = []
+        if not rows and not snapshots:
+            return
+
+        try:
+            if snapshots:
+                self.cursor.executemany('''
+                    INSERT INTO flow_snapshots (
+                        flow_id, packet_count, flow_duration, flow_bytes_per_second,
+                        forward_header_length, backward_header_length,
+                        packet_length_std_dev, packet_size_avg
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', snapshots)
+            if rows:
+                self.cursor.executemany('''
+                    INSERT INTO collected_data (
+                        timestamp, source_ip, destination_ip, source_port, 
+                        destination_port, protocol, header_length, packet_length
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+            self.db_connection.commit()
+        except sqlite3.Error:
+            # e.g. the database is locked by the feature extractor; keep the
+            # newest rows for the next flush so memory stays bounded
+            self.db_connection.rollback()
+            self.logger.exception("Failed to write %d packets, retrying on the next flush",
+                                  len(rows))
+            overflow = max(0, len(rows) - self.MAX_UNWRITTEN_ROWS)
+            self.rows_dropped += overflow
+            self.unwritten_rows = rows[overflow:]
+            self.unwritten_snapshots = snapshots[-self.MAX_UNWRITTEN_ROWS:]
+            return
+        self.rows_written += len(rows)
+
+    def _flush_loop(self):
+        while True:
+            hub.sleep(self.FLUSH_INTERVAL)
+            try:
+                self.flush_packets()
+            except Exception:
+                self.logger.exception("Error flushing captured packets")
+
+    def _report_loop(self):
+        while True:
+            hub.sleep(self.REPORT_INTERVAL)
+            self.logger.info("Packet capture load (%d rows written, %d pending, %d dropped):",
+                             self.rows_written, len(self.unwritten_rows), self.rows_dropped)
+            self.workers.log_load_report(self.logger)
 
     def __del__(self):
         # Close the database connection on app shutdown
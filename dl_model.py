@@ -1,22 +1,33 @@
-import pandas as pd
 import numpy as np
 import joblib
 from tensorflow import keras
+import argparse
 import sqlite3
+import time
+from ids_features import FEATURE_COLUMNS
+from prefilter import ThresholdPreFilter, TreePreFilter
 
 class DLModelApp:
-    def __init__(self, model_path: str, scaler_path: str, db_path: str):
+    def __init__(self, model_path: str, scaler_path: str, db_path: str, use_pandas: bool = False,
+                 prefilter=None):
         """
         Initialize the DLModelApp with paths to the model, scaler, and database.
+        Set use_pandas to run the original DataFrame based preprocessing.
+        An optional prefilter (see prefilter.py) decides which flows need the deep model.
         """
         self.model_path = model_path
         self.scaler_path = scaler_path
         self.db_path = db_path
+        self.use_pandas = use_pandas
+        self.prefilter = prefilter
         self.model = None
         self.scaler = None
         self.data = None
         self.x_test = None
         self.flow_id = None
+        self.suspicious = None
+        self.tier_counts = None
+        self.last_sequence_id = None
 
     def load_scaler(self):
         """Load the saved Standard Scaler for normalization."""
@@ -26,12 +37,22 @@ class DLModelApp:
         """Normalize test data using the loaded scaler."""
         self.x_test = self.scaler.transform(self.x_test)
 
+    def normalize_data_inplace(self):
+        """Apply the scaler's mean and scale to the float32 feature buffer in place."""
+        if getattr(self.scaler, 'with_mean', True) and self.scaler.mean_ is not None:
+            self.x_test -= self.scaler.mean_.astype(np.float32)
+        if getattr(self.scaler, 'with_std', True) and self.scaler.scale_ is not None:
+            self.x_test /= self.scaler.scale_.astype(np.float32)
+
     def load_model(self):
         """Load the pre-trained TensorFlow model."""
         self.model = keras.models.load_model(self.model_path)
 
     def load_data(self):
         """Load and preprocess the dataset from the database."""
+        # Only the use_pandas path needs pandas, so import it here
+        import pandas as pd
+
         # Connect to the database
         connection = sqlite3.connect(self.db_path)
         
@@ -47,12 +68,122 @@ class DLModelApp:
         # Close the connection
         connection.close()
 
+    def load_data_numpy(self):
+        """Read the feature columns straight into a preallocated float32 array."""
+        # Autocommit mode so the explicit BEGIN below controls the transaction
+        connection = sqlite3.connect(self.db_path, isolation_level=None)
+        cursor = connection.cursor()
+
+        # Count and read inside one transaction so both see the same rows
+        cursor.execute("BEGIN")
+
+        # Size the buffer up front so rows are copied in without reallocation
+        cursor.execute("SELECT COUNT(*) FROM extracted_features")
+        n_rows = cursor.fetchone()[0]
+        self.x_test = np.empty((n_rows, len(FEATURE_COLUMNS)), dtype=np.float32)
+        self.flow_id = np.empty(n_rows, dtype=object)
+
+        cursor.execute(f"SELECT flow_id, {', '.join(FEATURE_COLUMNS)} FROM extracted_features")
+        for i, row in enumerate(cursor):
+            self.flow_id[i] = row[0]
+            self.x_test[i] = row[1:]
+
+        cursor.execute("COMMIT")
+        connection.close()
+
+    def check_sequence_model(self):
+        """Make sure the loaded model takes the six features of a flow as input."""
+        shape = tuple(self.model.input_shape)[1:]
+        if None in shape or int(np.prod(shape)) != len(FEATURE_COLUMNS):
+            raise ValueError(
+                f"{self.model_path} expects input shape {shape}, but sequence mode feeds "
+                f"the {len(FEATURE_COLUMNS)} running features of each flow.")
+
+    def load_sequences(self) -> int:
+        """
+        Load the pending flow snapshots into a preallocated float32 array and
+        return how many were loaded. The rows stay in the database until
+        delete_sequences is called.
+        """
+        connection = sqlite3.connect(self.db_path, isolation_level=None)
+        cursor = connection.cursor()
+
+        # Count and read inside one transaction so both see the same rows
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT COUNT(*) FROM flow_snapshots")
+        n_rows = cursor.fetchone()[0]
+        self.x_test = np.empty((n_rows, len(FEATURE_COLUMNS)), dtype=np.float32)
+        self.flow_id = np.empty(n_rows, dtype=object)
+
+        cursor.execute(f"SELECT id, flow_id, {', '.join(FEATURE_COLUMNS)} FROM flow_snapshots "
+                       f"ORDER BY id")
+        for i, row in enumerate(cursor):
+            self.last_sequence_id = row[0]
+            self.flow_id[i] = row[1]
+            self.x_test[i] = row[2:]
+
+        cursor.execute("COMMIT")
+        connection.close()
+        return n_rows
+
+    def delete_sequences(self):
+        """Remove the snapshots returned by the last load_sequences call."""
+        connection = sqlite3.connect(self.db_path)
+        cursor = connection.cursor()
+
+        # Only delete what was read, the collector may have added more since
+        cursor.execute("DELETE FROM flow_snapshots WHERE id <= ?", (self.last_sequence_id,))
+
+        connection.commit()
+        connection.close()
+
+    def apply_prefilter(self):
+        """Run the first tier over the raw (unscaled) features."""
+        if self.prefilter is None:
+            self.suspicious = None
+            return
+        self.suspicious = self.prefilter.suspicious(np.asarray(self.x_test, dtype=np.float32))
+
     def make_predictions(self) -> np.ndarray:
-        """Make predictions using the loaded model."""
-        y_pred_prob = self.model.predict(self.x_test)
-        y_pred = np.argmax(y_pred_prob, axis=1)
+        """Make predictions using the loaded model, only on flows the prefilter forwards."""
+        if self.suspicious is None:
+            y_pred_prob = self.model.predict(self.x_test)
+            y_pred = np.argmax(y_pred_prob, axis=1)
+            self.tier_counts = (len(y_pred), 0, len(y_pred))
+            return y_pred
+
+        # Flows cleared by the prefilter are labelled normal (0)
+        y_pred = np.zeros(len(self.suspicious), dtype=np.int64)
+        n_forwarded = int(self.suspicious.sum())
+        if n_forwarded:
+            y_pred_prob = self.model.predict(np.asarray(self.x_test)[self.suspicious])
+            y_pred[self.suspicious] = np.argmax(y_pred_prob, axis=1)
+        self.tier_counts = (len(y_pred), len(y_pred) - n_forwarded, n_forwarded)
         return y_pred
 
+    def save_tier_counts(self):
+        """Record how many flows each detection tier handled in this run."""
+        connection = sqlite3.connect(self.db_path)
+        cursor = connection.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tier_counts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp REAL,
+                total_flows INTEGER,
+                prefiltered_flows INTEGER,
+                model_flows INTEGER
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO tier_counts (timestamp, total_flows, prefiltered_flows, model_flows)
+            VALUES (?, ?, ?, ?)
+        """, (time.time(),) + self.tier_counts)
+
+        connection.commit()
+        connection.close()
+        print('Tier counts: %d flows, %d cleared by prefilter, %d sent to model.' % self.tier_counts)
+
     def save_predictions(self, y_pred: np.ndarray):
         """Save the predictions to the database."""
         # Connect to the database
@@ -80,22 +211,69 @@ class DLModelApp:
 
     def run(self):
         """Execute the full pipeline of loading, predicting, and saving results."""
-        self.load_data()
         self.load_scaler()
-        self.normalize_data()
+        if self.use_pandas:
+            self.load_data()
+            self.apply_prefilter()
+            self.normalize_data()
+        else:
+            self.load_data_numpy()
+            self.apply_prefilter()
+            self.normalize_data_inplace()
         self.load_model()
         y_pred = self.make_predictions()
         self.save_predictions(y_pred)
+        self.save_tier_counts()
+
+    def run_sequences(self, poll_interval: float = 0.5):
+        """Keep the model loaded and classify flow snapshots as soon as they arrive."""
+        self.load_scaler()
+        self.load_model()
+        self.check_sequence_model()
+        while True:
+            if self.load_sequences():
+                self.apply_prefilter()
+                self.normalize_data_inplace()
+                # Shape the (flows, 6) batch the way the model expects, e.g. (flows, 6, 1)
+                self.x_test = self.x_test.reshape((-1,) + tuple(self.model.input_shape[1:]))
+                y_pred = self.make_predictions()
+                self.save_predictions(y_pred)
+                self.save_tier_counts()
+                # Snapshots are only dropped once their predictions are stored
+                self.delete_sequences()
+            else:
+                time.sleep(poll_interval)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Classify the extracted flows.")
+    parser.add_argument('--sequence', action='store_true',
+                        help="keep running and classify flows every SEQUENCE_WINDOW packets")
+    # The prefilter clears flows without the model, so it is only enabled explicitly
+    prefilter_group = parser.add_mutually_exclusive_group()
+    prefilter_group.add_argument('--prefilter', action='store_true',
+                                 help="enable the threshold prefilter tier")
+    prefilter_group.add_argument('--tree', metavar='MODEL.pkl',
+                                 help="enable a scikit-learn tree saved with joblib as the prefilter tier")
+    args = parser.parse_args()
+
+    prefilter = None
+    if args.tree:
+        prefilter = TreePreFilter(args.tree)
+    elif args.prefilter:
+        prefilter = ThresholdPreFilter()
+
     # Initialize the app with the appropriate paths
     app = DLModelApp(
         model_path='trans6_bi_model.h5',
         scaler_path='standard_scaler_Trans_bi.pkl',
-        db_path='ids_data.db'
+        db_path='ids_data.db',
+        prefilter=prefilter
     )
     
     # Run the application
-    app.run()
+    if args.sequence:
+        app.run_sequences()
+    else:
+        app.run()
 
@@ -0,0 +1,97 @@
+from collections import deque
+from ryu.lib import hub
+import time
+
+
+class DatapathWorkerPool:
+    """
+    Spread PacketIn processing over a fixed set of green-thread workers.
+
+    Every datapath has its own bounded queue, so a busy switch can only drop
+    its own PacketIns. Each datapath is pinned to one worker (dpid modulo the
+    pool size), which keeps its packets in order, and a worker serves the
+    queues of its datapaths round-robin, one item each per pass. The workers
+    are eventlet green threads and give no CPU parallelism; the pool only
+    bounds memory and keeps a busy switch from starving the others.
+    """
+
+    def __init__(self, handler, logger, num_workers=4, queue_size=1024):
+        self.handler = handler
+        self.logger = logger
+        self.queue_size = queue_size
+        # dpid -> deque of pending items
+        self.queues = {}
+        self.stats = {}
+        # Per worker: the dpids it serves and an event set when work arrives
+        self.assigned = [[] for _ in range(num_workers)]
+        self.wakeups = [hub.Event() for _ in range(num_workers)]
+        self.threads = [hub.spawn(self._worker, i) for i in range(num_workers)]
+
+    def _worker_index(self, dpid):
+        return dpid % len(self.assigned)
+
+    def _get_stats(self, dpid):
+        if dpid not in self.stats:
+            self.stats[dpid] = {'received': 0, 'processed': 0, 'dropped': 0,
+                                'errors': 0, 'busy_time': 0.0}
+        return self.stats[dpid]
+
+    def submit(self, dpid, item):
+        """Queue an item for this datapath, return False if its queue is full."""
+        stats = self._get_stats(dpid)
+        stats['received'] += 1
+        queue = self.queues.get(dpid)
+        if queue is None:
+            queue = self.queues[dpid] = deque()
+            self.assigned[self._worker_index(dpid)].append(dpid)
+        if len(queue) >= self.queue_size:
+            stats['dropped'] += 1
+            return False
+        queue.append(item)
+        self.wakeups[self._worker_index(dpid)].set()
+        return True
+
+    def _worker(self, index):
+        wakeup = self.wakeups[index]
+        while True:
+            # Clear before scanning: anything submitted while we process sets
+            # the event again, so the wait below cannot miss it
+            wakeup.clear()
+            served = False
+            for dpid in list(self.assigned[index]):
+                queue = self.queues[dpid]
+                if not queue:
+                    continue
+                served = True
+                self._process(dpid, queue.popleft())
+                # Yield so the other workers get their turn
+                hub.sleep(0)
+            if not served:
+                wakeup.wait()
+
+    def _process(self, dpid, item):
+        stats = self._get_stats(dpid)
+        start = time.time()
+        try:
+            self.handler(dpid, item)
+        except Exception:
+            stats['errors'] += 1
+            self.logger.exception("Error handling PacketIn from dpid %s", dpid)
+        stats['processed'] += 1
+        stats['busy_time'] += time.time() - start
+
+    def load_report(self):
+        """Return per-datapath counters together with the depth of their queue."""
+        report = {}
+        for dpid, stats in self.stats.items():
+            report[dpid] = dict(stats, worker=self._worker_index(dpid),
+                                queue_depth=len(self.queues.get(dpid, ())))
+        return report
+
+    def log_load_report(self, logger):
+        for dpid, stats in sorted(self.load_report().items()):
+            logger.info("dpid %s: worker=%d received=%d processed=%d dropped=%d "
+                        "errors=%d queue_depth=%d busy=%.3fs",
+                        dpid, stats['worker'], stats['received'], stats['processed'],
+                        stats['dropped'], stats['errors'], stats['queue_depth'],
+                        stats['busy_time'])
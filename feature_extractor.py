@@ -38,7 +38,8 @@ class FeatureExtractorApp:
         # Close the database connection
         connection.close()
 
-    def get_flow_id(self, src_ip, dst_ip, src_port, dst_port, protocol):
+    @staticmethod
+    def get_flow_id(src_ip, dst_ip, src_port, dst_port, protocol):
         """
         Returns a canonical flow ID that treats forward and reverse flows as the same flow.
         """
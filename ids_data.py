@@ -42,6 +42,32 @@ cursor.execute('''
     )
 ''')
 
+# Table 4: Flow Snapshots (running features of a flow, taken every K packets in sequence mode)
+cursor.execute('''
+    CREATE TABLE IF NOT EXISTS flow_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        flow_id TEXT,
+        packet_count INTEGER,
+        flow_duration REAL,
+        flow_bytes_per_second REAL,
+        forward_header_length INTEGER,
+        backward_header_length INTEGER,
+        packet_length_std_dev REAL,
+        packet_size_avg REAL
+    )
+''')
+
+# Table 5: Tier Counts (flows handled by the prefilter and by the deep model per run)
+cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tier_counts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp REAL,
+        total_flows INTEGER,
+        prefiltered_flows INTEGER,
+        model_flows INTEGER
+    )
+''')
+
 # Commit the changes and close the connection
 conn.commit()
 conn.close()
@@ -0,0 +1,9 @@
+# Feature columns of the extracted_features table, in model input order
+FEATURE_COLUMNS = [
+    'flow_duration',
+    'flow_bytes_per_second',
+    'forward_header_length',
+    'backward_header_length',
+    'packet_length_std_dev',
+    'packet_size_avg',
+]
@@ -0,0 +1,50 @@
+import numpy as np
+import joblib
+from ids_features import FEATURE_COLUMNS
+
+# Raw (unscaled) feature ranges of obviously benign flows. These are hand-picked
+# and not calibrated on labelled data, so the prefilter is off by default.
+DEFAULT_BENIGN_RANGES = {
+    'flow_bytes_per_second': (0, 1e5),
+    'forward_header_length': (0, 2e4),
+    'backward_header_length': (0, 2e4),
+    'packet_length_std_dev': (0, 600),
+    'packet_size_avg': (80, 1500),
+}
+
+
+class ThresholdPreFilter:
+    """
+    First detection tier: a vectorized range check over the raw features.
+
+    A flow is treated as benign only when every checked feature lies inside
+    its benign range; anything else is forwarded to the deep model.
+    """
+
+    def __init__(self, benign_ranges=None):
+        ranges = dict(DEFAULT_BENIGN_RANGES, **(benign_ranges or {}))
+        self.columns = [FEATURE_COLUMNS.index(name) for name in ranges]
+        self.low = np.array([low for low, _ in ranges.values()], dtype=np.float32)
+        self.high = np.array([high for _, high in ranges.values()], dtype=np.float32)
+
+    def suspicious(self, x: np.ndarray) -> np.ndarray:
+        """Return a boolean mask of the flows that need the deep model."""
+        features = x[:, self.columns]
+        return ((features < self.low) | (features > self.high)).any(axis=1)
+
+
+class TreePreFilter:
+    """
+    First detection tier backed by a small scikit-learn classifier (for example
+    a shallow DecisionTreeClassifier) trained on the raw features and saved
+    with joblib. Flows whose attack probability reaches `threshold` are
+    forwarded to the deep model.
+    """
+
+    def __init__(self, model_path: str, threshold: float = 0.1):
+        self.model = joblib.load(model_path)
+        self.threshold = threshold
+
+    def suspicious(self, x: np.ndarray) -> np.ndarray:
+        """Return a boolean mask of the flows that need the deep model."""
+        return self.model.predict_proba(x)[:, 1] >= self.threshold
@@ -12,6 +12,12 @@ class IDS(app_manager.RyuApp):
         # Intialize GUI flag 
         self.gui = True
 
+        # Also classify each flow every SEQUENCE_WINDOW packets instead of only
+        # per cycle (enable SEQUENCE_MODE in data_collector.py and
+        # MIRROR_TO_CONTROLLER in simple_switch.py as well)
+        self.sequence_mode = False
+        self.sequence_process = None
+
         # Start the Ryu apps (data_collector and simple_switch)
         self.start_ryu_apps()
 
@@ -23,6 +29,10 @@ class IDS(app_manager.RyuApp):
             # Start both data_collector.py and simple_switch.py together in one line
             subprocess.Popen('ryu-manager simple_switch.py data_collector.py', shell=True)
 
+            if self.sequence_mode:
+                # Keep the model loaded and classify flow snapshots as they arrive
+                self.sequence_process = subprocess.Popen(['python3', 'dl_model.py', '--sequence'])
+
             # Continuously monitor and process the collected data
             self.monitor_and_process_data()
         except Exception as e:
@@ -37,6 +47,11 @@ class IDS(app_manager.RyuApp):
             time.sleep(10)  # Check for new data every 10 seconds (adjustable)           
             self.run_feature_extraction_and_prediction()
 
+            if self.sequence_process is not None and self.sequence_process.poll() is not None:
+                self.logger.error(f"Sequence mode prediction exited with code "
+                                  f"{self.sequence_process.returncode}")
+                self.sequence_process = None
+
     def run_feature_extraction_and_prediction(self):
         """Run feature extraction and prediction after detecting new data."""
         try:
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import numpy as np
+from feature_extractor import FeatureExtractorApp
+
+# Running flow statistics kept per slot
+_FIRST_TS, _BYTES, _FWD_HDR, _BWD_HDR, _MEAN, _M2 = range(6)
+
+
+class FlowSequenceTable:
+    """
+    Track the running features of each active flow packet by packet.
+
+    For every flow the table keeps the same six features as extracted_features,
+    updated with each packet, and reports the flow every `window` packets so it
+    can be classified without waiting for the next extraction cycle. All state
+    lives in arrays preallocated for `max_flows` flows; when the table is full
+    the least recently seen flow is evicted.
+    """
+
+    N_FEATURES = 6
+
+    def __init__(self, window=8, max_flows=4096):
+        self.window = window
+        self.max_flows = max_flows
+        self.features = np.zeros((max_flows, self.N_FEATURES), dtype=np.float32)
+        self.stats = np.zeros((max_flows, 6), dtype=np.float64)
+        self.counts = np.zeros(max_flows, dtype=np.int64)
+
+        # flow_id -> slot, ordered from least to most recently seen
+        self.slots = OrderedDict()
+        self.free_slots = list(range(max_flows - 1, -1, -1))
+
+    def _allocate(self, flow_id):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            _, slot = self.slots.popitem(last=False)
+        self.stats[slot] = 0
+        self.counts[slot] = 0
+        self.slots[flow_id] = slot
+        return slot
+
+    def add_packet(self, timestamp, src_ip, dst_ip, src_port, dst_port, protocol,
+                   header_length, packet_length):
+        """
+        Record a packet and return its flow ID once the flow has `window` new
+        packets since it was last reported, otherwise None.
+        """
+        flow_id = FeatureExtractorApp.get_flow_id(src_ip, dst_ip, src_port, dst_port, protocol)
+        slot = self.slots.get(flow_id)
+        if slot is None:
+            slot = self._allocate(flow_id)
+        else:
+            self.slots.move_to_end(flow_id)
+
+        stats = self.stats[slot]
+        count = self.counts[slot] + 1
+        self.counts[slot] = count
+
+        if count == 1:
+            stats[_FIRST_TS] = timestamp
+        stats[_BYTES] += packet_length
+        if src_ip == flow_id[0] and dst_ip == flow_id[1]:
+            stats[_FWD_HDR] += header_length
+        else:
+            stats[_BWD_HDR] += header_length
+
+        # Welford's update for the packet length mean and variance
+        delta = packet_length - stats[_MEAN]
+        stats[_MEAN] += delta / count
+        stats[_M2] += delta * (packet_length - stats[_MEAN])
+
+        duration = timestamp - stats[_FIRST_TS]
+        vector = self.features[slot]
+        vector[0] = duration
+        vector[1] = stats[_BYTES] / duration if duration > 0 else 0
+        vector[2] = stats[_FWD_HDR]
+        vector[3] = stats[_BWD_HDR]
+        vector[4] = np.sqrt(stats[_M2] / (count - 1)) if count > 1 else 0
+        vector[5] = stats[_MEAN]
+
+        if count % self.window == 0:
+            return flow_id
+        return None
+
+    def get_features(self, flow_id):
+        """Return a copy of a flow's current six features."""
+        return self.features[self.slots[flow_id]].copy()
+
+    def packet_count(self, flow_id):
+        return int(self.counts[self.slots[flow_id]])
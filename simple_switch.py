@@ -16,19 +16,63 @@
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
+from ryu.lib import hub
 from ryu.lib.packet import packet
 from ryu.lib.packet import ethernet
 from ryu.lib.packet import ether_types
+from dp_workers import DatapathWorkerPool
+import time
 
 
 class SimpleSwitch13(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
+    # Learned flows expire so the flow table does not grow without bound
+    IDLE_TIMEOUT = 30
+    HARD_TIMEOUT = 300
+    # Upper bound on learned flows installed per datapath
+    MAX_FLOWS = 1000
+    # FlowMods are queued and written to the switch in batches
+    FLOW_BATCH_SIZE = 32
+    FLOW_BATCH_INTERVAL = 0.1  # seconds
+    # Repeated floods of the same unknown destination are dropped in this window
+    FLOOD_SUPPRESS_INTERVAL = 1.0  # seconds
+    # PacketIns are handled on per-datapath workers
+    NUM_WORKERS = 4
+    WORKER_QUEUE_SIZE = 1024
+    REPORT_INTERVAL = 30.0  # seconds between per-datapath load reports
+    # Also send every packet of learned flows to the controller from the
+    # switch where the source host is attached. Needed by the collector's
+    # sequence mode, since installed flows otherwise stop PacketIns for a
+    # host pair after its first packets.
+    MIRROR_TO_CONTROLLER = False
+
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
         self.mac_to_port = {}
+        # mac -> dpid of the first switch that learned it, i.e. the switch
+        # the host is attached to
+        self.host_ingress = {}
+
+        # dpid -> (datapath, [pending FlowMods])
+        self.pending_flows = {}
+        # dpid -> {FlowMod xid: flow key} of sent FlowMods not yet confirmed
+        self.flow_mod_xids = {}
+        # dpid -> {barrier xid: [FlowMod xids sent before the barrier]}
+        self.pending_barriers = {}
+        # dpid -> {(in_port, eth_src, eth_dst), ...} of installed learned flows
+        self.installed_flows = {}
+        # dpid -> {flood key: time of last flood}
+        self.recent_floods = {}
+
+        self.flow_batch_thread = hub.spawn(self._flow_batch_loop)
+
+        self.workers = DatapathWorkerPool(self.handle_packet_in, self.logger,
+                                          self.NUM_WORKERS, self.WORKER_QUEUE_SIZE)
+        self.report_thread = hub.spawn(self._report_loop)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -48,7 +92,8 @@ class SimpleSwitch13(app_manager.RyuApp):
                                           ofproto.OFPCML_NO_BUFFER)]
         self.add_flow(datapath, 0, match, actions)
 
-    def add_flow(self, datapath, priority, match, actions, buffer_id=None):
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None,
+                 idle_timeout=0, hard_timeout=0, flags=0, batch=False):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
@@ -57,11 +102,136 @@ class SimpleSwitch13(app_manager.RyuApp):
         if buffer_id:
             mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
                                     priority=priority, match=match,
+                                    idle_timeout=idle_timeout,
+                                    hard_timeout=hard_timeout, flags=flags,
                                     instructions=inst)
         else:
             mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                    match=match, instructions=inst)
-        datapath.send_msg(mod)
+                                    match=match, idle_timeout=idle_timeout,
+                                    hard_timeout=hard_timeout, flags=flags,
+                                    instructions=inst)
+        if batch:
+            self.queue_flow_mod(datapath, mod)
+        else:
+            datapath.send_msg(mod)
+
+    def queue_flow_mod(self, datapath, mod):
+        """Queue a FlowMod and flush the batch once it is full."""
+        _, pending = self.pending_flows.setdefault(datapath.id, (datapath, []))
+        pending.append(mod)
+        if len(pending) >= self.FLOW_BATCH_SIZE:
+            self.flush_flow_mods(datapath.id)
+
+    @staticmethod
+    def _flow_key(match):
+        return (match.get('in_port'), match.get('eth_src'), match.get('eth_dst'))
+
+    def flush_flow_mods(self, dpid):
+        """Write all queued FlowMods of a datapath in a single send."""
+        datapath, pending = self.pending_flows.pop(dpid, (None, []))
+        if not pending:
+            return
+        parser = datapath.ofproto_parser
+        xids = self.flow_mod_xids.setdefault(dpid, {})
+
+        buf = bytearray()
+        for mod in pending:
+            datapath.set_xid(mod)
+            mod.serialize()
+            buf += mod.buf
+            xids[mod.xid] = self._flow_key(mod.match)
+
+        # Errors for the batch arrive before the barrier reply, so once the
+        # reply is in the FlowMods are known to be installed
+        barrier = parser.OFPBarrierRequest(datapath)
+        datapath.set_xid(barrier)
+        barrier.serialize()
+        buf += barrier.buf
+        self.pending_barriers.setdefault(dpid, {})[barrier.xid] = [
+            mod.xid for mod in pending]
+
+        datapath.send(bytes(buf))
+
+    def _flow_batch_loop(self):
+        """Periodically flush partial batches and expire flood records."""
+        while True:
+            hub.sleep(self.FLOW_BATCH_INTERVAL)
+            for dpid in list(self.pending_flows):
+                self.flush_flow_mods(dpid)
+
+            now = time.time()
+            for floods in self.recent_floods.values():
+                expired = [key for key, last in floods.items()
+                           if now - last > self.FLOOD_SUPPRESS_INTERVAL]
+                for key in expired:
+                    del floods[key]
+
+    def should_flood(self, dpid, src, dst, data):
+        """Return False if the same flood was already sent very recently."""
+        # Unicast frames are keyed by address pair so retransmissions towards
+        # an unknown host are suppressed; broadcast and multicast frames are
+        # keyed by content so only identical repeats (e.g. storms) are dropped.
+        if int(dst.split(':')[0], 16) & 1:
+            key = (src, dst, hash(data))
+        else:
+            key = (src, dst)
+
+        floods = self.recent_floods.setdefault(dpid, {})
+        now = time.time()
+        last = floods.get(key)
+        if last is not None and now - last <= self.FLOOD_SUPPRESS_INTERVAL:
+            return False
+        floods[key] = now
+        return True
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, DEAD_DISPATCHER)
+    def _state_change_handler(self, ev):
+        # Forget everything about a switch once it disconnects
+        dpid = ev.datapath.id
+        self.pending_flows.pop(dpid, None)
+        self.flow_mod_xids.pop(dpid, None)
+        self.pending_barriers.pop(dpid, None)
+        self.installed_flows.pop(dpid, None)
+        self.recent_floods.pop(dpid, None)
+        for mac in [mac for mac, ingress in self.host_ingress.items() if ingress == dpid]:
+            del self.host_ingress[mac]
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        key = self._flow_key(msg.match)
+        self.installed_flows.get(msg.datapath.id, set()).discard(key)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def _barrier_reply_handler(self, ev):
+        dpid = ev.msg.datapath.id
+        confirmed = self.pending_barriers.get(dpid, {}).pop(ev.msg.xid, [])
+        xids = self.flow_mod_xids.get(dpid, {})
+        for xid in confirmed:
+            xids.pop(xid, None)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, MAIN_DISPATCHER)
+    def _error_msg_handler(self, ev):
+        # A rejected FlowMod never produces a FlowRemoved, so forget the flow
+        # here or its packets would keep coming to the controller
+        msg = ev.msg
+        dpid = msg.datapath.id
+        key = self.flow_mod_xids.get(dpid, {}).pop(msg.xid, None)
+        if key is not None:
+            self.installed_flows.get(dpid, set()).discard(key)
+            self.logger.warning("FlowMod rejected on dpid %s for %s: "
+                                "type=0x%02x code=0x%02x",
+                                dpid, key, msg.type, msg.code)
+
+    def _report_loop(self):
+        while True:
+            hub.sleep(self.REPORT_INTERVAL)
+            self.logger.info("Switch load:")
+            for dpid, flows in sorted(self.installed_flows.items()):
+                self.logger.info("dpid %s: macs=%d flows=%d/%d", dpid,
+                                 len(self.mac_to_port.get(dpid, {})),
+                                 len(flows), self.MAX_FLOWS)
+            self.workers.log_load_report(self.logger)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
@@ -71,6 +241,20 @@ class SimpleSwitch13(app_manager.RyuApp):
             self.logger.debug("packet truncated: only %s of %s bytes",
                               ev.msg.msg_len, ev.msg.total_len)
         msg = ev.msg
+        if msg.reason == msg.datapath.ofproto.OFPR_ACTION:
+            # Mirrored copy of a packet an installed flow already forwarded
+            return
+        if not self.workers.submit(msg.datapath.id, msg):
+            # The datapath's queue is full (counted as dropped in the load
+            # report); still forward the packet so its buffer is released
+            self.logger.debug("PacketIn queue full for dpid %s, flooding",
+                              msg.datapath.id)
+            ofproto = msg.datapath.ofproto
+            parser = msg.datapath.ofproto_parser
+            self.send_packet_out(msg, msg.match['in_port'],
+                                 [parser.OFPActionOutput(ofproto.OFPP_FLOOD)])
+
+    def handle_packet_in(self, dpid, msg):
         datapath = msg.datapath
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
@@ -85,31 +269,70 @@ class SimpleSwitch13(app_manager.RyuApp):
         dst = eth.dst
         src = eth.src
 
-        dpid = datapath.id
         self.mac_to_port.setdefault(dpid, {})
 
-        self.logger.info("packet in %s %s %s %s", dpid, src, dst, in_port)
+        self.logger.debug("packet in %s %s %s %s", dpid, src, dst, in_port)
 
         # learn a mac address to avoid FLOOD next time.
         self.mac_to_port[dpid][src] = in_port
+        self.host_ingress.setdefault(src, dpid)
 
         if dst in self.mac_to_port[dpid]:
             out_port = self.mac_to_port[dpid][dst]
         else:
             out_port = ofproto.OFPP_FLOOD
+            if not self.should_flood(dpid, src, dst, msg.data):
+                # Drop further repeats at the switch for the suppression
+                # window; the drop flow also releases any buffered packet
+                match = parser.OFPMatch(in_port=in_port, eth_src=src,
+                                        eth_dst=dst, eth_type=eth.ethertype)
+                hard_timeout = max(1, int(round(self.FLOOD_SUPPRESS_INTERVAL)))
+                if msg.buffer_id != ofproto.OFP_NO_BUFFER:
+                    self.add_flow(datapath, 1, match, [], msg.buffer_id,
+                                  hard_timeout=hard_timeout)
+                else:
+                    self.add_flow(datapath, 1, match, [],
+                                  hard_timeout=hard_timeout)
+                return
 
         actions = [parser.OFPActionOutput(out_port)]
 
         # install a flow to avoid packet_in next time
-        if out_port != ofproto.OFPP_FLOOD:
+        installed = self.installed_flows.setdefault(dpid, set())
+        key = (in_port, src, dst)
+        if (out_port != ofproto.OFPP_FLOOD and key not in installed
+                and len(installed) < self.MAX_FLOWS):
+            installed.add(key)
             match = parser.OFPMatch(in_port=in_port, eth_dst=dst, eth_src=src)
+            flow_actions = actions
+            mirror = (self.MIRROR_TO_CONTROLLER
+                      and self.host_ingress.get(src) == dpid)
+            if mirror:
+                # Only the ingress switch mirrors, so each packet reaches
+                # the controller once however many hops it crosses
+                flow_actions = actions + [parser.OFPActionOutput(
+                    ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
             # verify if we have a valid buffer_id, if yes avoid to send both
-            # flow_mod & packet_out
-            if msg.buffer_id != ofproto.OFP_NO_BUFFER:
-                self.add_flow(datapath, 1, match, actions, msg.buffer_id)
+            # flow_mod & packet_out. A mirroring flow must not take the
+            # buffered packet, or its copy would reach the controller twice.
+            if msg.buffer_id != ofproto.OFP_NO_BUFFER and not mirror:
+                self.add_flow(datapath, 1, match, flow_actions, msg.buffer_id,
+                              idle_timeout=self.IDLE_TIMEOUT,
+                              hard_timeout=self.HARD_TIMEOUT,
+                              flags=ofproto.OFPFF_SEND_FLOW_REM, batch=True)
                 return
             else:
-                self.add_flow(datapath, 1, match, actions)
+                self.add_flow(datapath, 1, match, flow_actions,
+                              idle_timeout=self.IDLE_TIMEOUT,
+                              hard_timeout=self.HARD_TIMEOUT,
+                              flags=ofproto.OFPFF_SEND_FLOW_REM, batch=True)
+        self.send_packet_out(msg, in_port, actions)
+
+    def send_packet_out(self, msg, in_port, actions):
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
         data = None
         if msg.buffer_id == ofproto.OFP_NO_BUFFER:
             data = msg.data